@@ -1,19 +1,50 @@
-from multiprocessing import Pool
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import operator
+import os
 from tqdm import tqdm
 from teras.training.listeners import ProgressBar
 from more_itertools import chunked
 
-def concurrent_apply(func, iterator, process_num=70):
-    pool = Pool(processes=process_num)
-    if not isinstance(iterator, list):
-        iterator = list(iterator)
-    total = len(iterator)
+DEFAULT_CHUNKSIZE = 64
+
+def _apply_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+def concurrent_apply(func, iterator, process_num=None):
+    """
+    Apply `func` to each item on `process_num` worker processes
+    (defaults to `os.cpu_count()`) and return the results in input order.
+    Items are read lazily in chunks, with at most `4 * process_num` chunks
+    in flight at a time.
+    """
+    workers = process_num if process_num is not None else os.cpu_count() or 1
+    max_pending = workers * 4
+    try:
+        total = len(iterator)
+    except TypeError:
+        total = operator.length_hint(iterator, 0) or None
+    if total:
+        chunksize = max(1, min(DEFAULT_CHUNKSIZE, total // max_pending))
+    else:
+        chunksize = DEFAULT_CHUNKSIZE
     pbar = ProgressBar(lambda n: tqdm(total=n))
     pbar.init(total)
     ret_list = []
-    for ret in pool.imap_unordered(func, iterator):
-        ret_list += [ret]
-        pbar.update(1)
+
+    def _collect(future):
+        rets = future.result()
+        ret_list.extend(rets)
+        pbar.update(len(rets))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunked(iterator, chunksize):
+            if len(pending) >= max_pending:
+                _collect(pending.popleft())
+            pending.append(executor.submit(_apply_chunk, func, chunk))
+        while pending:
+            _collect(pending.popleft())
     pbar.close()
     return ret_list
 
@@ -21,20 +52,91 @@ def concurrent_apply(func, iterator, process_num=70):
 import subprocess
 import json
 
-def get_gpu_info(nvidia_smi_path='nvidia-smi', keys=('index', 'uuid'), no_units=True):
-    nu_opt = '' if not no_units else ',nounits'
-    cmd = '%s --query-gpu=%s --format=csv,noheader%s' % (nvidia_smi_path, ','.join(keys), nu_opt)
-    output = subprocess.check_output(cmd, shell=True)
-    lines = output.decode().split('\n')
-    lines = [ line.strip() for line in lines if line.strip() != '' ]
+try:
+    import pynvml
+    pynvml.nvmlInit()
+except Exception:
+    pynvml = None
 
-    return [ { k: v for k, v in zip(keys, line.split(', ')) } for line in lines ]
 
-def get_process_info_on_gpus(nvidia_smi_path='nvidia-smi', keys=('pid','name','gpu_uuid','used_gpu_memory'), no_units=True):
+def _nvml_call(func, *args):
+    try:
+        return func(*args)
+    except pynvml.NVMLError:
+        return None
+
+def _str(value):
+    if value is None:
+        return '[N/A]'
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+def _mib(value):
+    return '[N/A]' if value is None else str(value // (1024 * 1024))
+
+_NVML_GPU_QUERIES = {
+    'index': lambda i, h, mem, util: str(i),
+    'uuid': lambda i, h, mem, util: _str(_nvml_call(pynvml.nvmlDeviceGetUUID, h)),
+    'name': lambda i, h, mem, util: _str(_nvml_call(pynvml.nvmlDeviceGetName, h)),
+    'memory.total': lambda i, h, mem, util: _mib(getattr(mem, 'total', None)),
+    'memory.used': lambda i, h, mem, util: _mib(getattr(mem, 'used', None)),
+    'memory.free': lambda i, h, mem, util: _mib(getattr(mem, 'free', None)),
+    'utilization.gpu': lambda i, h, mem, util: _str(getattr(util, 'gpu', None)),
+    'utilization.memory': lambda i, h, mem, util: _str(getattr(util, 'memory', None)),
+}
+
+_NVML_PROCESS_QUERIES = {
+    'pid': lambda uuid, p: str(p.pid),
+    'name': lambda uuid, p: _str(_nvml_call(pynvml.nvmlSystemGetProcessName, p.pid)),
+    'process_name': lambda uuid, p: _str(_nvml_call(pynvml.nvmlSystemGetProcessName, p.pid)),
+    'gpu_uuid': lambda uuid, p: uuid,
+    'used_gpu_memory': lambda uuid, p: _mib(p.usedGpuMemory),
+    'used_memory': lambda uuid, p: _mib(p.usedGpuMemory),
+}
+
+def _use_nvml(queries, keys, no_units):
+    return pynvml is not None and no_units and all(k in queries for k in keys)
+
+def _query_nvidia_smi(nvidia_smi_path, query, keys, no_units):
     nu_opt = '' if not no_units else ',nounits'
-    cmd = '%s --query-compute-apps=%s --format=csv,noheader%s' % (nvidia_smi_path, ','.join(keys), nu_opt)
+    cmd = '%s --query-%s=%s --format=csv,noheader%s' % (nvidia_smi_path, query, ','.join(keys), nu_opt)
     output = subprocess.check_output(cmd, shell=True)
     lines = output.decode().split('\n')
     lines = [ line.strip() for line in lines if line.strip() != '' ]
 
     return [ { k: v for k, v in zip(keys, line.split(', ')) } for line in lines ]
+
+def get_gpu_info(nvidia_smi_path='nvidia-smi', keys=('index', 'uuid'), no_units=True):
+    """
+    Values that NVML cannot report are returned as '[N/A]'.
+    `nvidia_smi_path` is only used when falling back to nvidia-smi, i.e. when
+    pynvml is unavailable, `no_units` is False or a key has no NVML query.
+    """
+    if not _use_nvml(_NVML_GPU_QUERIES, keys, no_units):
+        return _query_nvidia_smi(nvidia_smi_path, 'gpu', keys, no_units)
+    info = []
+    for i in range(pynvml.nvmlDeviceGetCount()):
+        handle = pynvml.nvmlDeviceGetHandleByIndex(i)
+        mem = util = None
+        if any(k.startswith('memory.') for k in keys):
+            mem = _nvml_call(pynvml.nvmlDeviceGetMemoryInfo, handle)
+        if any(k.startswith('utilization.') for k in keys):
+            util = _nvml_call(pynvml.nvmlDeviceGetUtilizationRates, handle)
+        info.append({ k: _NVML_GPU_QUERIES[k](i, handle, mem, util) for k in keys })
+    return info
+
+def get_process_info_on_gpus(nvidia_smi_path='nvidia-smi', keys=('pid','name','gpu_uuid','used_gpu_memory'), no_units=True):
+    """
+    Values that NVML cannot report (e.g. the name of a process in another
+    PID namespace) are returned as '[N/A]'.
+    `nvidia_smi_path` is only used when falling back to nvidia-smi, i.e. when
+    pynvml is unavailable, `no_units` is False or a key has no NVML query.
+    """
+    if not _use_nvml(_NVML_PROCESS_QUERIES, keys, no_units):
+        return _query_nvidia_smi(nvidia_smi_path, 'compute-apps', keys, no_units)
+    info = []
+    for i in range(pynvml.nvmlDeviceGetCount()):
+        handle = pynvml.nvmlDeviceGetHandleByIndex(i)
+        uuid = _str(_nvml_call(pynvml.nvmlDeviceGetUUID, handle))
+        for process in pynvml.nvmlDeviceGetComputeRunningProcesses(handle):
+            info.append({ k: _NVML_PROCESS_QUERIES[k](uuid, process) for k in keys })
+    return info
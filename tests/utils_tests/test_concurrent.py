@@ -0,0 +1,115 @@
+from types import SimpleNamespace
+import unittest
+from unittest import mock
+
+from teras.utils import concurrent
+
+
+MiB = 1024 * 1024
+
+
+class NVMLError(Exception):
+    pass
+
+
+def _square(x):
+    return x * x
+
+
+def _raise(*args):
+    raise NVMLError()
+
+
+def _stub_pynvml():
+    processes = {
+        0: [SimpleNamespace(pid=100, usedGpuMemory=64 * MiB),
+            SimpleNamespace(pid=200, usedGpuMemory=None)],
+        1: [],
+    }
+    names = {100: b'python'}
+
+    def get_process_name(pid):
+        if pid not in names:
+            raise NVMLError()
+        return names[pid]
+
+    def get_memory_info(handle):
+        memory_calls.append(handle)
+        return SimpleNamespace(total=8192 * MiB, used=1024 * MiB,
+                               free=7168 * MiB)
+
+    memory_calls = []
+    stub = SimpleNamespace(
+        NVMLError=NVMLError,
+        nvmlDeviceGetCount=lambda: 2,
+        nvmlDeviceGetHandleByIndex=lambda i: i,
+        nvmlDeviceGetUUID=lambda h: 'GPU-{}'.format(h).encode(),
+        nvmlDeviceGetName=lambda h: b'Tesla',
+        nvmlDeviceGetMemoryInfo=get_memory_info,
+        nvmlDeviceGetUtilizationRates=_raise,
+        nvmlDeviceGetComputeRunningProcesses=lambda h: processes[h],
+        nvmlSystemGetProcessName=get_process_name,
+        memory_calls=memory_calls,
+    )
+    return stub
+
+
+class TestNVML(unittest.TestCase):
+
+    def setUp(self):
+        self.pynvml = _stub_pynvml()
+        patcher = mock.patch.object(concurrent, 'pynvml', self.pynvml)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_gpu_info(self):
+        keys = ('index', 'uuid', 'name', 'memory.total', 'memory.used',
+                'memory.free', 'utilization.gpu')
+        info = concurrent.get_gpu_info(keys=keys)
+        self.assertEqual(info, [
+            {'index': '0', 'uuid': 'GPU-0', 'name': 'Tesla',
+             'memory.total': '8192', 'memory.used': '1024',
+             'memory.free': '7168', 'utilization.gpu': '[N/A]'},
+            {'index': '1', 'uuid': 'GPU-1', 'name': 'Tesla',
+             'memory.total': '8192', 'memory.used': '1024',
+             'memory.free': '7168', 'utilization.gpu': '[N/A]'},
+        ])
+        self.assertEqual(self.pynvml.memory_calls, [0, 1])
+
+    def test_get_process_info_on_gpus(self):
+        info = concurrent.get_process_info_on_gpus()
+        self.assertEqual(info, [
+            {'pid': '100', 'name': 'python', 'gpu_uuid': 'GPU-0',
+             'used_gpu_memory': '64'},
+            {'pid': '200', 'name': '[N/A]', 'gpu_uuid': 'GPU-0',
+             'used_gpu_memory': '[N/A]'},
+        ])
+
+    def test_fallback_to_nvidia_smi(self):
+        output = b'0, GPU-0, 1 MiB\n'
+        with mock.patch.object(concurrent.subprocess, 'check_output',
+                               return_value=output) as check_output:
+            info = concurrent.get_gpu_info(
+                nvidia_smi_path='/usr/bin/nvidia-smi',
+                keys=('index', 'uuid', 'memory.used'), no_units=False)
+        self.assertEqual(info, [
+            {'index': '0', 'uuid': 'GPU-0', 'memory.used': '1 MiB'}])
+        self.assertTrue(
+            check_output.call_args[0][0].startswith('/usr/bin/nvidia-smi '))
+
+
+class TestConcurrentApply(unittest.TestCase):
+
+    def test_list_and_generator(self):
+        n = 1000
+        expected = [x * x for x in range(n)]
+        rets1 = concurrent.concurrent_apply(_square, list(range(n)), 4)
+        rets2 = concurrent.concurrent_apply(
+            _square, (x for x in range(n)), 4)
+        self.assertEqual(rets1, expected)
+        self.assertEqual(rets2, expected)
+
+    def test_empty(self):
+        self.assertEqual(concurrent.concurrent_apply(_square, [], 2), [])
+        self.assertEqual(
+            concurrent.concurrent_apply(_square, iter([]), 2), [])